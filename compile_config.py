@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+VM Device Kill Switch - Configuration Compiler
+Precompiles devices.yaml and vms.yaml into a Python module for fast daemon startup
+"""
+
+import os
+import sys
+import ast
+import pprint
+import tempfile
+import yaml
+from pathlib import Path
+
+COMPILED_MODULE = "vm_killswitch_config.py"
+
+def compile_config(config_path: Path) -> Path:
+    """Write DEVICES/VMS literals parsed from the YAML configuration"""
+    with open(config_path / "devices.yaml", "r") as f:
+        devices = yaml.safe_load(f)
+    with open(config_path / "vms.yaml", "r") as f:
+        vms = yaml.safe_load(f)
+    
+    sources = []
+    for name, data in (("DEVICES", devices), ("VMS", vms)):
+        source = pprint.pformat(data, width=120)
+        # Values such as YAML timestamps do not round-trip as Python literals
+        try:
+            if ast.literal_eval(source) != data:
+                raise ValueError("round-trip mismatch")
+        except (ValueError, SyntaxError) as e:
+            raise ValueError(f"{name} is not plain literal data: {e}") from e
+        sources.append(f"{name} = {source}\n")
+    
+    # Write to a temp file and rename so the daemon never runs a half-written module
+    output = config_path / COMPILED_MODULE
+    fd, tmp_path = tempfile.mkstemp(dir=config_path, prefix=".vm_killswitch_config.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write("# Generated by compile_config.py - do not edit, edit the YAML files instead\n")
+            f.writelines(sources)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, output)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return output
+
+def main():
+    """Entry point"""
+    config_path = Path(sys.argv[1] if len(sys.argv) > 1 else "/opt/vm-killswitch/config")
+    try:
+        output = compile_config(config_path)
+    except ValueError as e:
+        print(f"Cannot compile configuration: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Compiled configuration written to {output}")
+
+if __name__ == "__main__":
+    main()
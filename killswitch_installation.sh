@@ -76,6 +76,10 @@ create_directories() {
     
     mkdir -p "$INSTALL_DIR"/{bin,config,lib,logs,systemd}
     
+    # Parsed configuration cache (the unit also declares it as CacheDirectory)
+    mkdir -p /var/cache/vm-killswitch
+    chmod 755 /var/cache/vm-killswitch
+    
     # Set permissions
     chown -R root:root "$INSTALL_DIR"
     chmod 755 "$INSTALL_DIR"
@@ -100,6 +104,15 @@ install_files() {
         exit 1
     fi
     
+    # Copy configuration compiler
+    if [[ -f "compile_config.py" ]]; then
+        cp "compile_config.py" "$INSTALL_DIR/bin/"
+        chmod 755 "$INSTALL_DIR/bin/compile_config.py"
+    else
+        error "compile_config.py not found in current directory"
+        exit 1
+    fi
+    
     # Copy CLI tool
     if [[ -f "killswitch-cli" ]]; then
         cp "killswitch-cli" "$INSTALL_DIR/bin/"
@@ -181,6 +194,11 @@ EOF
     # Set permissions
     chmod 644 "$INSTALL_DIR/config/"*.yaml
     
+    # Precompile configuration for fast daemon startup (must stay root-owned, 644)
+    python3 "$INSTALL_DIR/bin/compile_config.py" "$INSTALL_DIR/config"
+    chown root:root "$INSTALL_DIR/config/vm_killswitch_config.py"
+    chmod 644 "$INSTALL_DIR/config/vm_killswitch_config.py"
+    
     success "Configuration files installed"
 }
 
@@ -210,6 +228,7 @@ NoNewPrivileges=false
 PrivateTmp=true
 ProtectSystem=strict
 ReadWritePaths=$INSTALL_DIR/logs /tmp /var/run
+CacheDirectory=vm-killswitch
 ProtectHome=true
 
 # Capabilities needed for device management
@@ -314,14 +333,17 @@ echo
 echo "2. Edit VM configuration:"
 echo "   sudo nano /opt/vm-killswitch/config/vms.yaml"
 echo
-echo "3. Test configuration:"
+echo "3. Recompile configuration:"
+echo "   sudo python3 /opt/vm-killswitch/bin/compile_config.py"
+echo
+echo "4. Test configuration:"
 echo "   sudo killswitch test --verbose"
 echo
-echo "4. Start service:"
+echo "5. Start service:"
 echo "   sudo systemctl enable vm-killswitch"
 echo "   sudo systemctl start vm-killswitch"
 echo
-echo "5. Check status:"
+echo "6. Check status:"
 echo "   killswitch status"
 echo
 echo "Available devices on this system:"
@@ -341,6 +363,7 @@ post_install_message() {
     echo "1. Configure your devices and VMs:"
     echo "   sudo nano $INSTALL_DIR/config/devices.yaml"
     echo "   sudo nano $INSTALL_DIR/config/vms.yaml"
+    echo "   sudo python3 $INSTALL_DIR/bin/compile_config.py  # Recompile after edits"
     echo
     echo "2. Test the configuration:"
     echo "   sudo killswitch test --verbose"
@@ -395,6 +418,7 @@ case "${1:-install}" in
         rm -f "/etc/modules-load.d/vm-killswitch.conf"
         rm -f "/usr/local/bin/killswitch"
         rm -rf "$INSTALL_DIR"
+        rm -rf /var/cache/vm-killswitch
         userdel "$SYSTEM_USER" 2>/dev/null || true
         systemctl daemon-reload
         udevadm control --reload-rules
@@ -6,17 +6,148 @@ Manages hot-plug/unplug of audio/video devices from QEMU VMs
 
 import json
 import socket
-import subprocess
 import logging
-import yaml
 import time
 import os
 import signal
+import select
+import ctypes
 import sys
+import importlib.util
+import tempfile
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
 from enum import Enum
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+try:
+    import orjson
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
+    _loads = json.loads
+
+# Capabilities negotiation sent on every new QMP connection
+_QMP_CAPS_CMD = b'{"execute":"qmp_capabilities"}\n'
+
+def _encode_command(cmd: dict, cmd_id: str) -> bytes:
+    """Serialize a QMP command tagged with an id, ready to be pipelined"""
+    return _dumps({**cmd, "id": cmd_id}) + b"\n"
+
+# Device enumeration results keyed by function, as (timestamp, result)
+_CACHE: Dict[str, Tuple[float, list]] = {}
+
+def ttl_cache(ttl: float) -> Callable:
+    """Cache a function's list result in _CACHE for ttl seconds"""
+    def decorator(func: Callable[[], list]) -> Callable[[], list]:
+        @wraps(func)
+        def wrapper() -> list:
+            now = time.monotonic()
+            cached = _CACHE.get(func.__qualname__)
+            if cached and now - cached[0] < ttl:
+                return list(cached[1])
+            result = func()
+            _CACHE[func.__qualname__] = (now, result)
+            return list(result)
+        return wrapper
+    return decorator
+
+# inotify(7) constants
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CLOEXEC = 0o2000000
+
+def _inotify_watch(directory: str, mask: int) -> Optional[int]:
+    """Return an inotify fd watching directory, or None if inotify is unavailable"""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(IN_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    
+    if libc.inotify_add_watch(fd, directory.encode(), mask) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+# Writable under the unit's ProtectSystem=strict via CacheDirectory=
+CACHE_DIR = Path("/var/cache/vm-killswitch")
+
+def _load_cached(path: Path, cache_dir: Path = CACHE_DIR) -> dict:
+    """Load a YAML file, reusing its JSON cache when that is up to date"""
+    cache = cache_dir / (path.name + ".json")
+    try:
+        if cache.stat().st_mtime >= path.stat().st_mtime:
+            with open(cache, "r") as f:
+                cached = json.load(f)
+            # The cache directory is shared, so check which file this came from
+            if cached.get("source") == str(path):
+                return cached["data"]
+    except (OSError, ValueError, AttributeError, KeyError):
+        pass
+    
+    # PyYAML is only needed when neither cache is current
+    import yaml
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    with open(path, "r") as f:
+        data = yaml.load(f, Loader=loader)
+    
+    # Write to a temp file and rename so a failed dump never leaves a fresh-looking cache
+    tmp_path = None
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=f".{cache.name}.", suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"source": str(path), "data": data}, f)
+        os.replace(tmp_path, cache)
+    except (OSError, TypeError, ValueError) as e:
+        logging.warning(f"Failed to write config cache {cache}: {e}")
+        if tmp_path:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+    return data
+
+def _root_only_writable(path: Path) -> bool:
+    """True if path is owned by root and not group/world-writable"""
+    st = path.stat()
+    return st.st_uid == 0 and not st.st_mode & 0o022
+
+def _load_compiled(config_path: Path) -> Optional[Tuple[dict, dict]]:
+    """Return (devices, vms) from vm_killswitch_config.py if it is newer than the YAML files"""
+    module_path = config_path / "vm_killswitch_config.py"
+    try:
+        module_mtime = module_path.stat().st_mtime
+        for name in ("devices.yaml", "vms.yaml"):
+            if (config_path / name).stat().st_mtime > module_mtime:
+                return None
+        
+        # The module is executed as root, so refuse anything another user could have written
+        if not (_root_only_writable(module_path) and _root_only_writable(config_path)):
+            logging.warning(f"Ignoring {module_path}: not root-owned or writable by others")
+            return None
+        
+        spec = importlib.util.spec_from_file_location("vm_killswitch_config", module_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module.DEVICES, module.VMS
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        # Any broken module falls back to the YAML/JSON path
+        logging.warning(f"Ignoring {module_path}: {e}")
+        return None
+
+# dataclass(slots=True) needs Python 3.10; older interpreters keep __dict__
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
 
 class DeviceType(Enum):
     PCI = "pci"
@@ -28,7 +159,7 @@ class DeviceState(Enum):
     TRANSITIONING = "transitioning"
     ERROR = "error"
 
-@dataclass
+@dataclass(**_SLOTS)
 class Device:
     name: str
     device_type: DeviceType
@@ -37,34 +168,45 @@ class Device:
     product_id: Optional[str] = None
     target_vm: str = ""
     state: DeviceState = DeviceState.DETACHED
+    # QMP device id and serialized QMP commands, filled in by load_configuration
+    qmp_id: str = field(default="", init=False)
+    _attach_json: bytes = field(default=b"", init=False, repr=False)
+    _detach_json: bytes = field(default=b"", init=False, repr=False)
 
-@dataclass
+@dataclass(**_SLOTS)
 class VM:
     name: str
     qmp_socket: str
     devices: List[str]
     running: bool = False
 
+class QMPConnectionLost(ConnectionError):
+    """The peer was gone before any command of a batch could take effect"""
+
 class QMPClient:
     """QEMU Monitor Protocol client for VM communication"""
     
     def __init__(self, socket_path: str):
         self.socket_path = socket_path
         self.sock = None
+        self._rfile = None
     
     def connect(self) -> bool:
         try:
             self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
             self.sock.settimeout(5.0)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 65536)
+            # Room for a whole pipelined batch in a single write
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 262144)
             self.sock.connect(self.socket_path)
+            self._rfile = self.sock.makefile("rb", buffering=65536)
             
             # QMP handshake
-            greeting = self.sock.recv(4096)
+            greeting = self._rfile.readline()
             logging.debug(f"QMP greeting: {greeting}")
             
             # Send capabilities negotiation
-            qmp_cmd = {"execute": "qmp_capabilities"}
-            self._send_command(qmp_cmd)
+            self.sock.sendall(_QMP_CAPS_CMD)
             response = self._receive_response()
             
             return response.get("return") == {}
@@ -73,40 +215,99 @@ class QMPClient:
             return False
     
     def disconnect(self):
+        if self._rfile:
+            self._rfile.close()
+            self._rfile = None
         if self.sock:
             self.sock.close()
             self.sock = None
     
-    def _send_command(self, command: dict):
-        cmd_json = json.dumps(command) + "\n"
-        self.sock.send(cmd_json.encode())
+    def is_connected(self) -> bool:
+        """Check without blocking that the peer has not closed the socket"""
+        if not self.sock:
+            return False
+        timeout = self.sock.gettimeout()
+        try:
+            self.sock.setblocking(False)
+            return self.sock.recv(1, socket.MSG_PEEK) != b""
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+        finally:
+            self.sock.settimeout(timeout)
     
     def _receive_response(self) -> dict:
-        response = b""
-        while True:
-            chunk = self.sock.recv(1024)
-            if not chunk:
-                break
-            response += chunk
-            if b"\n" in response:
-                break
-        
-        return json.loads(response.decode().strip())
+        line = self._rfile.readline()
+        if not line:
+            raise EOFError("QMP connection closed")
+        return _loads(line)
     
-    def execute_command(self, command: str, **kwargs) -> dict:
-        qmp_cmd = {"execute": command}
-        if kwargs:
-            qmp_cmd["arguments"] = kwargs
+    def send_encoded_batch(self, payloads: List[bytes], ids: List[str]) -> List[dict]:
+        """Pipeline pre-serialized commands carrying the given ids
         
-        self._send_command(qmp_cmd)
-        return self._receive_response()
+        Raises QMPConnectionLost only when the batch cannot have reached QEMU,
+        so that case alone is safe to resend.
+        """
+        try:
+            self.sock.sendall(b"".join(payloads))
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise QMPConnectionLost(f"QMP connection lost: {e}") from e
+        
+        responses: Dict[str, dict] = {}
+        while len(responses) < len(ids):
+            try:
+                response = self._receive_response()
+            except EOFError as e:
+                if not responses:
+                    raise QMPConnectionLost("QMP connection closed before any reply") from e
+                raise
+            if "event" in response:
+                logging.debug(f"QMP event: {response['event']}")
+            elif response.get("id") in ids:
+                responses[response["id"]] = response
+            else:
+                raise ValueError(f"Unexpected QMP reply: {response}")
+        
+        return [responses[cmd_id] for cmd_id in ids]
 
 class DeviceManager:
     """Manages device identification and host-side operations"""
     
     @staticmethod
+    @ttl_cache(5.0)
     def get_usb_devices() -> List[Tuple[str, str, str]]:
         """Returns list of (vendor_id, product_id, device_path)"""
+        sysfs = Path("/sys/bus/usb/devices")
+        if not sysfs.is_dir():
+            return DeviceManager._lsusb_devices()
+        
+        try:
+            entries = list(sysfs.iterdir())
+        except OSError as e:
+            logging.error(f"Failed to enumerate USB devices: {e}")
+            return []
+        
+        devices = []
+        for entry in entries:
+            # Interfaces and other non-device entries have no idVendor
+            if not (entry / "idVendor").exists():
+                continue
+            try:
+                vendor = (entry / "idVendor").read_text().strip()
+                product = (entry / "idProduct").read_text().strip()
+                busnum = int((entry / "busnum").read_text())
+                devnum = int((entry / "devnum").read_text())
+            except (OSError, ValueError):
+                # Unplugged while scanning
+                continue
+            devices.append((vendor, product, f"/dev/bus/usb/{busnum:03d}/{devnum:03d}"))
+        return devices
+    
+    @staticmethod
+    def _lsusb_devices() -> List[Tuple[str, str, str]]:
+        """USB enumeration through lsusb, for hosts without sysfs"""
+        import subprocess
         devices = []
         try:
             result = subprocess.run(['lsusb'], capture_output=True, text=True)
@@ -123,8 +324,37 @@ class DeviceManager:
         return devices
     
     @staticmethod
+    @ttl_cache(5.0)
     def get_pci_devices() -> List[Tuple[str, str]]:
         """Returns list of (pci_id, description)"""
+        sysfs = Path("/sys/bus/pci/devices")
+        if not sysfs.is_dir():
+            return DeviceManager._lspci_devices()
+        
+        try:
+            entries = sorted(sysfs.iterdir())
+        except OSError as e:
+            logging.error(f"Failed to enumerate PCI devices: {e}")
+            return []
+        
+        devices = []
+        for entry in entries:
+            try:
+                vendor = (entry / "vendor").read_text().strip()[2:]
+                device = (entry / "device").read_text().strip()[2:]
+                pci_class = (entry / "class").read_text().strip()[2:6]
+            except OSError:
+                # Removed while scanning
+                continue
+            # Match lspci, which omits the default 0000 domain
+            pci_id = entry.name[5:] if entry.name.startswith("0000:") else entry.name
+            devices.append((pci_id, f"{pci_class}: {vendor}:{device}"))
+        return devices
+    
+    @staticmethod
+    def _lspci_devices() -> List[Tuple[str, str]]:
+        """PCI enumeration through lspci, for hosts without sysfs"""
+        import subprocess
         devices = []
         try:
             result = subprocess.run(['lspci', '-n'], capture_output=True, text=True)
@@ -169,6 +399,7 @@ class KillSwitchDaemon:
         self.config_path = Path(config_path)
         self.devices: Dict[str, Device] = {}
         self.vms: Dict[str, VM] = {}
+        self._qmp: Dict[str, QMPClient] = {}
         self.state_secure = False
         self.running = True
         
@@ -187,10 +418,14 @@ class KillSwitchDaemon:
     def load_configuration(self):
         """Load device and VM configurations"""
         try:
-            # Load devices
-            with open(self.config_path / "devices.yaml", "r") as f:
-                device_config = yaml.safe_load(f)
+            compiled = _load_compiled(self.config_path)
+            if compiled:
+                device_config, vm_config = compiled
+            else:
+                device_config = _load_cached(self.config_path / "devices.yaml")
+                vm_config = _load_cached(self.config_path / "vms.yaml")
             
+            # Load devices
             self.devices = {}
             
             # Load audio devices
@@ -217,10 +452,13 @@ class KillSwitchDaemon:
                 )
                 self.devices[device.name] = device
             
-            # Load VMs
-            with open(self.config_path / "vms.yaml", "r") as f:
-                vm_config = yaml.safe_load(f)
+            # Serialize QMP commands once, tagged with the device name for pipelining
+            for device in self.devices.values():
+                device.qmp_id = f"{'usb' if device.device_type == DeviceType.USB else 'pci'}-{device.name.replace(' ', '_')}"
+                device._attach_json = _encode_command(self._build_attach_cmd(device), device.name)
+                device._detach_json = _encode_command(self._build_detach_cmd(device), device.name)
             
+            # Load VMs
             self.vms = {}
             for vm_data in vm_config["virtual_machines"]:
                 vm = VM(
@@ -236,118 +474,164 @@ class KillSwitchDaemon:
             logging.error(f"Failed to load configuration: {e}")
             sys.exit(1)
     
-    def attach_device_to_vm(self, device: Device) -> bool:
-        """Attach device to its target VM"""
-        vm = self.vms.get(device.target_vm)
-        if not vm:
-            logging.error(f"Target VM {device.target_vm} not found")
-            return False
+    def _get_qmp(self, vm: VM) -> Optional[QMPClient]:
+        """Return the pooled QMP connection for a VM, connecting on first use"""
+        qmp = self._qmp.get(vm.name)
+        # Only catches a cleanly closed socket; _send_to_vm handles the rest
+        if qmp and qmp.is_connected():
+            return qmp
         
-        device.state = DeviceState.TRANSITIONING
+        if qmp:
+            qmp.disconnect()
+        qmp = QMPClient(vm.qmp_socket)
+        if not qmp.connect():
+            qmp.disconnect()
+            self._qmp.pop(vm.name, None)
+            return None
         
-        try:
-            qmp = QMPClient(vm.qmp_socket)
-            if not qmp.connect():
-                logging.error(f"Failed to connect to VM {vm.name}")
-                device.state = DeviceState.ERROR
-                return False
-            
-            if device.device_type == DeviceType.USB:
-                # Add USB device
-                response = qmp.execute_command(
-                    "device_add",
-                    driver="usb-host",
-                    id=f"usb-{device.name.replace(' ', '_')}",
-                    vendorid=f"0x{device.vendor_id}",
-                    productid=f"0x{device.product_id}"
-                )
-            else:  # PCI device
-                # Add PCI device (VFIO passthrough)
-                response = qmp.execute_command(
-                    "device_add", 
-                    driver="vfio-pci",
-                    id=f"pci-{device.name.replace(' ', '_')}",
-                    host=device.device_id
-                )
-            
+        self._qmp[vm.name] = qmp
+        return qmp
+    
+    def _drop_qmp(self, vm_name: str):
+        """Close and forget the pooled QMP connection for a VM"""
+        qmp = self._qmp.pop(vm_name, None)
+        if qmp:
             qmp.disconnect()
-            
-            if "error" in response:
-                logging.error(f"QMP error attaching {device.name}: {response['error']}")
-                device.state = DeviceState.ERROR
-                return False
-            
-            device.state = DeviceState.ATTACHED
-            logging.info(f"Attached {device.name} to VM {vm.name}")
-            return True
-            
-        except Exception as e:
-            logging.error(f"Failed to attach device {device.name}: {e}")
+    
+    def _send_to_vm(self, vm: VM, payloads: List[bytes], ids: List[str]) -> List[dict]:
+        """Send a batch over the VM's pooled connection, reconnecting once if it has gone stale"""
+        pooled = vm.name in self._qmp
+        qmp = self._get_qmp(vm)
+        if not qmp:
+            raise ConnectionError(f"Failed to connect to VM {vm.name}")
+        
+        try:
+            return qmp.send_encoded_batch(payloads, ids)
+        except QMPConnectionLost as e:
+            # Nothing reached QEMU, so resending cannot duplicate a device_add
+            self._drop_qmp(vm.name)
+            if not pooled:
+                raise
+            logging.warning(f"Pooled QMP connection to VM {vm.name} failed ({e}) - reconnecting")
+        except Exception:
+            # Timeouts and unexpected replies: commands may have run, never resend
+            self._drop_qmp(vm.name)
+            raise
+        
+        qmp = self._get_qmp(vm)
+        if not qmp:
+            raise ConnectionError(f"Failed to connect to VM {vm.name}")
+        return qmp.send_encoded_batch(payloads, ids)
+    
+    def _build_attach_cmd(self, device: Device) -> dict:
+        """Build the QMP device_add command for a device"""
+        if device.device_type == DeviceType.USB:
+            # Add USB device
+            arguments = {
+                "driver": "usb-host",
+                "id": device.qmp_id,
+                "vendorid": f"0x{device.vendor_id}",
+                "productid": f"0x{device.product_id}"
+            }
+        else:  # PCI device
+            # Add PCI device (VFIO passthrough)
+            arguments = {
+                "driver": "vfio-pci",
+                "id": device.qmp_id,
+                "host": device.device_id
+            }
+        return {"execute": "device_add", "arguments": arguments}
+    
+    def _build_detach_cmd(self, device: Device) -> dict:
+        """Build the QMP device_del command for a device"""
+        return {"execute": "device_del", "arguments": {"id": device.qmp_id}}
+    
+    def _record_result(self, vm: VM, device: Device, response: dict, attach: bool) -> bool:
+        """Update device state from its QMP reply"""
+        if "error" in response:
+            action = "attaching" if attach else "detaching"
+            logging.error(f"QMP error {action} {device.name}: {response['error']}")
             device.state = DeviceState.ERROR
             return False
+        
+        if attach:
+            device.state = DeviceState.ATTACHED
+            logging.info(f"Attached {device.name} to VM {vm.name}")
+        else:
+            device.state = DeviceState.DETACHED
+            logging.info(f"Detached {device.name} from VM {vm.name}")
+        return True
     
-    def detach_device_from_vm(self, device: Device) -> bool:
-        """Detach device from its target VM"""
-        vm = self.vms.get(device.target_vm)
+    def _apply_to_vm(self, vm_name: str, devices: List[Device], attach: bool) -> int:
+        """Attach or detach all devices of one VM with a single pipelined QMP batch"""
+        vm = self.vms.get(vm_name)
         if not vm:
-            return False
+            logging.error(f"Target VM {vm_name} not found")
+            return 0
         
-        device.state = DeviceState.TRANSITIONING
+        for device in devices:
+            device.state = DeviceState.TRANSITIONING
         
         try:
-            qmp = QMPClient(vm.qmp_socket)
-            if not qmp.connect():
-                logging.error(f"Failed to connect to VM {vm.name}")
-                device.state = DeviceState.ERROR
-                return False
-            
-            device_id = f"{'usb' if device.device_type == DeviceType.USB else 'pci'}-{device.name.replace(' ', '_')}"
-            
-            response = qmp.execute_command("device_del", id=device_id)
-            qmp.disconnect()
-            
-            if "error" in response:
-                logging.error(f"QMP error detaching {device.name}: {response['error']}")
-                device.state = DeviceState.ERROR
-                return False
-            
-            device.state = DeviceState.DETACHED
-            logging.info(f"Detached {device.name} from VM {vm.name}")
-            return True
-            
+            payloads = [device._attach_json if attach else device._detach_json for device in devices]
+            responses = self._send_to_vm(vm, payloads, [device.name for device in devices])
         except Exception as e:
-            logging.error(f"Failed to detach device {device.name}: {e}")
-            device.state = DeviceState.ERROR
-            return False
+            logging.error(f"Failed to {'attach' if attach else 'detach'} devices on VM {vm.name}: {e}")
+            for device in devices:
+                device.state = DeviceState.ERROR
+            self._drop_qmp(vm.name)
+            return 0
+        
+        success_count = sum(
+            self._record_result(vm, device, response, attach)
+            for device, response in zip(devices, responses)
+        )
+        
+        # Reconnect next time rather than reuse a connection in an unknown state
+        if success_count != len(devices):
+            self._drop_qmp(vm.name)
+        return success_count
+    
+    def _apply_to_all(self, devices: List[Device], attach: bool) -> int:
+        """Attach or detach devices, running one worker per target VM"""
+        groups: Dict[str, List[Device]] = {}
+        for device in devices:
+            groups.setdefault(device.target_vm, []).append(device)
+        
+        if not groups:
+            return 0
+        
+        with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            futures = [
+                executor.submit(self._apply_to_vm, vm_name, devices, attach)
+                for vm_name, devices in groups.items()
+            ]
+            return sum(future.result() for future in futures)
     
     def toggle_kill_switch(self):
         """Toggle between secure and operational states"""
         if self.state_secure:
             # Switch to operational - attach devices
             logging.info("Kill switch OFF - Attaching devices to VMs")
-            success_count = 0
-            for device in self.devices.values():
-                if self.attach_device_to_vm(device):
-                    success_count += 1
+            targets = [d for d in self.devices.values() if d.state != DeviceState.ATTACHED]
+            success_count = self._apply_to_all(targets, attach=True)
             
-            if success_count == len(self.devices):
+            if all(d.state == DeviceState.ATTACHED for d in self.devices.values()):
                 self.state_secure = False
                 logging.info("All devices attached - System operational")
             else:
-                logging.warning(f"Only {success_count}/{len(self.devices)} devices attached")
+                logging.warning(f"Only {success_count}/{len(targets)} devices attached")
         else:
             # Switch to secure - detach devices
             logging.info("Kill switch ON - Detaching all devices from VMs")
-            success_count = 0
-            for device in self.devices.values():
-                if self.detach_device_from_vm(device):
-                    success_count += 1
+            targets = [d for d in self.devices.values() if d.state != DeviceState.DETACHED]
+            success_count = self._apply_to_all(targets, attach=False)
             
-            if success_count == len(self.devices):
+            if all(d.state == DeviceState.DETACHED for d in self.devices.values()):
                 self.state_secure = True
                 logging.info("All devices detached - System secure")
             else:
-                logging.warning(f"Only {success_count}/{len(self.devices)} devices detached")
+                logging.warning(f"Only {success_count}/{len(targets)} devices detached")
     
     def monitor_kill_switch_trigger(self):
         """Monitor for kill switch activation (placeholder implementation)"""
@@ -355,18 +639,53 @@ class KillSwitchDaemon:
         # Options: GPIO monitoring, keyboard shortcut, network trigger, etc.
         
         trigger_file = "/tmp/vm-killswitch-trigger"
+        # IN_ATTRIB covers `touch` on a trigger file that was left behind
+        inotify_fd = _inotify_watch(os.path.dirname(trigger_file), IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO)
+        if inotify_fd is None:
+            logging.warning("inotify unavailable - polling for kill switch trigger")
+            self._poll_kill_switch_trigger(trigger_file)
+            return
+        
+        try:
+            # Pick up a trigger written before the watch was set up
+            readable = True
+            while self.running:
+                try:
+                    if readable:
+                        # Other files in the directory wake us too
+                        if os.path.exists(trigger_file):
+                            logging.info("Kill switch triggered")
+                            self.toggle_kill_switch()
+                            # Remove trigger file
+                            os.remove(trigger_file)
+                    
+                    readable = bool(select.select([inotify_fd], [], [], 1.0)[0])
+                    if readable:
+                        os.read(inotify_fd, 4096)
+                except InterruptedError:
+                    readable = False
+                except Exception as e:
+                    logging.error(f"Error monitoring trigger: {e}")
+                    readable = False
+        finally:
+            os.close(inotify_fd)
+    
+    def _poll_kill_switch_trigger(self, trigger_file: str):
+        """Poll the trigger file when inotify is not available"""
         last_mtime = 0
         
         while self.running:
             try:
-                if os.path.exists(trigger_file):
-                    current_mtime = os.path.getmtime(trigger_file)
-                    if current_mtime != last_mtime:
-                        logging.info("Kill switch triggered")
-                        self.toggle_kill_switch()
-                        last_mtime = current_mtime
-                        # Remove trigger file
-                        os.remove(trigger_file)
+                # One stat() per tick; a missing file is the common case
+                st = os.stat(trigger_file)
+                if st.st_mtime != last_mtime:
+                    logging.info("Kill switch triggered")
+                    self.toggle_kill_switch()
+                    last_mtime = st.st_mtime
+                    # Remove trigger file
+                    os.remove(trigger_file)
+            except FileNotFoundError:
+                pass
             except Exception as e:
                 logging.error(f"Error monitoring trigger: {e}")
             
@@ -375,28 +694,47 @@ class KillSwitchDaemon:
     def signal_handler(self, signum, frame):
         """Handle shutdown signals gracefully"""
         logging.info(f"Received signal {signum} - shutting down")
+        # A toggle may be in flight on the pooled connections, so the
+        # secure-detach runs from run() once the monitor loop returns
         self.running = False
-        
-        # Ensure system is in secure state before shutdown
-        if not self.state_secure:
+    
+    def shutdown(self):
+        """Secure the system and close QMP connections"""
+        # Ensure system is in secure state before shutdown; per-device state
+        # catches devices left attached by a partial toggle
+        targets = [d for d in self.devices.values() if d.state != DeviceState.DETACHED]
+        if targets:
             logging.info("Securing system before shutdown")
-            for device in self.devices.values():
-                self.detach_device_from_vm(device)
+            self._apply_to_all(targets, attach=False)
+        
+        for vm_name in list(self._qmp):
+            self._drop_qmp(vm_name)
+    
+    def hangup_handler(self, signum, frame):
+        """Drop cached device enumeration on SIGHUP"""
+        logging.info(f"Received signal {signum} - clearing device cache")
+        _CACHE.clear()
     
     def run(self):
         """Main daemon loop"""
         # Register signal handlers
         signal.signal(signal.SIGTERM, self.signal_handler)
         signal.signal(signal.SIGINT, self.signal_handler)
+        signal.signal(signal.SIGHUP, self.hangup_handler)
         
         logging.info("VM Kill Switch Daemon started")
         
-        # Initialize in secure state
-        self.state_secure = False
-        self.toggle_kill_switch()
-        
-        # Start monitoring
-        self.monitor_kill_switch_trigger()
+        try:
+            # Initialize in secure state; actual device placement is unknown at startup
+            self.state_secure = False
+            for device in self.devices.values():
+                device.state = DeviceState.ERROR
+            self.toggle_kill_switch()
+            
+            # Start monitoring
+            self.monitor_kill_switch_trigger()
+        finally:
+            self.shutdown()
         
         logging.info("VM Kill Switch Daemon stopped")
 